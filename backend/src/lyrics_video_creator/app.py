@@ -0,0 +1,414 @@
+import asyncio
+import hashlib
+import logging
+import logging.config
+import os
+import shutil
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any
+
+import uvicorn
+from fastapi import Depends, FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+
+from lyrics_video_creator.lib import (
+    add_translations,
+    align_lyrics,
+    correct_lyrics_timing,
+    create_lyric_video,
+    preload_resources,
+    prune_cache,
+    split_lyrics_lines,
+    translate_lines,
+)
+
+
+class SkipSuccessfulAccessFilter(logging.Filter):
+    # 正常に処理されたリクエスト (200 OK) のアクセスログを出力しない
+    def filter(self, record: logging.LogRecord) -> bool:
+        # uvicorn のアクセスログの引数: (クライアント, メソッド, パス, HTTPバージョン, ステータスコード)
+        args = record.args
+        return not (isinstance(args, tuple) and len(args) == 5 and args[4] == 200)
+
+
+# ログ設定を辞書形式で定義
+LOGGING_CONFIG = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "filters": {
+        "skip_successful_access": {"()": SkipSuccessfulAccessFilter},
+    },
+    "formatters": {
+        "default": {
+            "()": "uvicorn.logging.DefaultFormatter",
+            "fmt": "%(levelprefix)s %(asctime)s - %(name)s - %(message)s",
+            "datefmt": "%Y-%m-%d %H:%M:%S",
+        },
+    },
+    "handlers": {
+        "default": {
+            "formatter": "default",
+            "class": "logging.StreamHandler",
+            "stream": "ext://sys.stderr",
+        },
+        "file": {
+            "formatter": "default",
+            "class": "logging.handlers.RotatingFileHandler",
+            "filename": "app.log",  # 出力ファイル名
+            "maxBytes": 1024 * 1024 * 5,  # 5MB
+            "backupCount": 3,
+            "encoding": "utf-8",
+        },
+        # ファイルへの書き込みをまとめて行うため、ログをメモリ上にバッファリングする
+        # (ERROR 以上のログが出力された場合は即座に書き込む)
+        "buffered_file": {
+            "class": "logging.handlers.MemoryHandler",
+            "capacity": 128,
+            "flushLevel": logging.ERROR,
+            "target": "file",
+        },
+    },
+    "loggers": {
+        "": {"handlers": ["default", "buffered_file"], "level": "INFO"},
+        # uvicorn のログはルートロガーに伝播させ、ハンドラーをまとめて設定する
+        "uvicorn.error": {"level": "INFO"},
+        "uvicorn.access": {
+            "level": "INFO",
+            "filters": ["skip_successful_access"],
+        },
+    },
+}
+
+# ログ設定を適用
+logging.config.dictConfig(LOGGING_CONFIG)
+
+# ロガーのインスタンスを取得
+logger = logging.getLogger(__name__)
+
+# アップロードファイルを保存するディレクトリ
+UPLOADS_DIR = "uploads"
+# 古い一時ディレクトリとキャッシュを削除する間隔 (10分)
+UPLOADS_CLEANUP_INTERVAL = 10 * 60
+# この時間 (1時間) より前に更新された一時ディレクトリを削除する
+UPLOADS_MAX_AGE = 60 * 60
+
+
+def remove_stale_uploads() -> None:
+    # レスポンス送信後の削除に失敗したディレクトリなどが残り続けないよう、古いものを削除する
+    if not os.path.isdir(UPLOADS_DIR):
+        return
+
+    threshold = time.time() - UPLOADS_MAX_AGE
+    with os.scandir(UPLOADS_DIR) as entries:
+        for entry in entries:
+            # 他のワーカーやレスポンス送信後の処理が同時に削除している場合があるため、
+            # 取得に失敗したエントリは無視する
+            try:
+                is_stale = entry.is_dir() and entry.stat().st_mtime < threshold
+            except OSError:
+                continue
+            if is_stale:
+                logger.info(f"古い一時ディレクトリを削除します: {entry.path}")
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+
+async def cleanup_uploads_periodically() -> None:
+    while True:
+        # 削除に失敗しても、以降の定期的な削除は継続する
+        try:
+            await asyncio.to_thread(remove_stale_uploads)
+        except Exception:
+            logger.exception("古い一時ディレクトリの削除に失敗しました。")
+        # キャッシュが際限なく大きくならないよう、長く使われていないエントリを削除する
+        try:
+            await asyncio.to_thread(prune_cache)
+        except Exception:
+            logger.exception("キャッシュの削除に失敗しました。")
+        await asyncio.sleep(UPLOADS_CLEANUP_INTERVAL)
+
+
+# フォントの既定値
+DEFAULT_FONT_NAME_JA = "Noto Sans JP"
+DEFAULT_FONT_NAME_EN = "Arial"
+
+
+async def preload_resources_in_background() -> None:
+    # 最初のリクエストで読み込まれるモジュールやフォントなどを事前に読み込んでおく
+    try:
+        await asyncio.to_thread(
+            preload_resources, font_names=[DEFAULT_FONT_NAME_JA, DEFAULT_FONT_NAME_EN]
+        )
+        logger.info("リソースの事前読み込みが完了しました。")
+    except Exception:
+        # 事前読み込みに失敗しても、リクエストの処理時に改めて読み込まれる
+        logger.warning("リソースの事前読み込みに失敗しました。", exc_info=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # サーバーの起動を遅らせないよう、事前読み込みはバックグラウンドで行う
+    preload_task = asyncio.create_task(preload_resources_in_background())
+    # アプリケーションの起動中、定期的に古い一時ディレクトリを削除する
+    cleanup_task = asyncio.create_task(cleanup_uploads_periodically())
+    yield
+    cleanup_task.cancel()
+    preload_task.cancel()
+
+
+# FastAPIアプリケーションのインスタンスを作成
+app = FastAPI(
+    title="Lyrics Video Creator API",
+    description="API for creating lyric videos with music and images.",
+    version="0.1.0",
+    lifespan=lifespan,
+)
+
+# ここからCORS設定
+origins = [
+    "http://localhost:5173",  # Next.jsアプリケーションのオリジン
+    # 必要に応じて他のオリジンも追加できます
+    # 例: "http://localhost:3000" (Create React Appの場合など)
+]
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=origins,  # 許可するオリジンのリスト
+    allow_credentials=True,  # Cookieなどの認証情報を含むリクエストを許可するか
+    allow_methods=["*"],  # すべてのHTTPメソッドを許可 (GET, POST, PUT, DELETEなど)
+    allow_headers=["*"],  # すべてのHTTPヘッダーを許可
+)
+# ここまでCORS設定
+
+# 受け付けるファイルの拡張子 (フロントエンドで選択可能な形式)
+MUSIC_FILE_EXTENSIONS = {".mp3", ".wav", ".ogg", ".flac", ".m4a", ".aac"}
+IMAGE_FILE_EXTENSIONS = {
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".webp",
+    ".bmp",
+    ".pbm",
+    ".pgm",
+    ".ppm",
+    ".tif",
+    ".tiff",
+}
+
+# アップロードファイルを保存する際の読み込みサイズ (1MiB)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class VideoFileResponse(FileResponse):
+    # 動画ファイルは数十MBになるため、既定値 (64KiB) より大きな単位で読み込んで送信する
+    chunk_size = 1024 * 1024
+
+
+def save_upload_file(upload_file: UploadFile, path: str) -> str:
+    # ファイル全体をメモリに読み込まず、一定サイズずつディスクに書き込む
+    # (UploadFile.read() はチャンクごとにスレッドプールを経由するため、一時ファイルから直接コピーする)
+    # 同じファイルの再アップロードを検出できるよう、書き込みながらハッシュ値を計算して返す
+    digest = hashlib.blake2b()
+    with open(path, "wb") as f:
+        while chunk := upload_file.file.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+
+async def run_in_thread_timed(
+    func: Callable[..., Any], **kwargs: Any
+) -> tuple[Any, float]:
+    # 時間のかかる処理を別スレッドで実行し、結果と所要時間 (秒) を返す
+    start_time = time.perf_counter()
+    result = await asyncio.to_thread(func, **kwargs)
+    return result, time.perf_counter() - start_time
+
+
+async def gather_threads(*aws: Awaitable[Any]) -> list[Any]:
+    # 別スレッドの処理は中断できないため、一方が失敗しても他方の完了を待ってから例外を送出する
+    # (一時ディレクトリの削除と、他方の処理によるファイルの書き込みが競合しないようにする)
+    results = await asyncio.gather(*aws, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+class VideoParams(BaseModel):
+    # 動画の見た目に関するパラメータ
+    font_name_ja: str
+    font_name_en: str
+    font_color: str
+    font_size: int
+    outline_color: str
+    outline_size: int
+    bottom_margin: int
+    enable_fade: bool
+
+    @classmethod
+    def as_form(
+        cls,
+        font_name_ja: str = Form(default=DEFAULT_FONT_NAME_JA),
+        font_name_en: str = Form(default=DEFAULT_FONT_NAME_EN),
+        font_color: str = Form(default="#FFFFFF"),
+        font_size: int = Form(default=32, gt=0),
+        outline_color: str = Form(default="#000000"),
+        outline_size: int = Form(default=0, ge=0),
+        bottom_margin: int = Form(default=50, ge=0),
+        enable_fade: bool = Form(default=False),
+    ) -> "VideoParams":
+        # フォームの各フィールドをまとめて受け取る
+        return cls(
+            font_name_ja=font_name_ja,
+            font_name_en=font_name_en,
+            font_color=font_color,
+            font_size=font_size,
+            outline_color=outline_color,
+            outline_size=outline_size,
+            bottom_margin=bottom_margin,
+            enable_fade=enable_fade,
+        )
+
+
+@app.post("/create_video")
+async def create_video(
+    music_file: UploadFile = File(),
+    image_file: UploadFile = File(),
+    lyrics: str = Form(),
+    params: VideoParams = Depends(VideoParams.as_form),
+) -> VideoFileResponse:
+    # 各リクエストにユニークなIDを割り当て、ログ追跡を容易にする
+    request_id = uuid.uuid4().hex
+    logger.info(f"[Request ID: {request_id}] ビデオ作成リクエストを受理しました。")
+    logger.info(f"[Request ID: {request_id}] パラメータ: {params}")
+
+    # クライアントから送られたファイル名はパスに含めず、拡張子のみを使用する
+    # (ファイル名に "../" などが含まれていても、一時ディレクトリの外に書き込まれないようにする)
+    music_extension = Path(music_file.filename or "").suffix.lower()
+    image_extension = Path(image_file.filename or "").suffix.lower()
+    if music_extension not in MUSIC_FILE_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported music file type: {music_extension or '(none)'}",
+        )
+    if image_extension not in IMAGE_FILE_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported image file type: {image_extension or '(none)'}",
+        )
+
+    # 一時的なアップロードディレクトリをリクエストごとに作成
+    temp_dir = Path(UPLOADS_DIR) / request_id
+    temp_dir_path = str(temp_dir)
+
+    try:
+        temp_dir.mkdir(parents=True, exist_ok=True)
+
+        # ファイルを保存
+        music_filename = str(temp_dir / f"music{music_extension}")
+        image_filename = str(temp_dir / f"image{image_extension}")
+        video_filename = str(temp_dir / "output_video.mp4")
+
+        logger.info(
+            f"[Request ID: {request_id}] アップロードされたファイルを保存します: {temp_dir_path}"
+        )
+        # 2つのファイルは独立しているため、並行して保存する
+        music_digest, _ = await gather_threads(
+            asyncio.to_thread(save_upload_file, music_file, music_filename),
+            asyncio.to_thread(save_upload_file, image_file, image_filename),
+        )
+
+        # 以降の処理は時間がかかるため、イベントループをブロックしないよう別スレッドで実行する
+        # 歌詞の翻訳は歌詞のテキストのみに依存するため、アラインメントと並行して実行する
+        logger.info(
+            f"[Request ID: {request_id}] 歌詞のアラインメントと翻訳を実行しています..."
+        )
+        japanese_texts = split_lyrics_lines(lyrics)
+        (
+            (aligned_lyrics, align_seconds),
+            (translated_lines, translate_seconds),
+        ) = await gather_threads(
+            run_in_thread_timed(
+                align_lyrics,
+                workflow_slug="subtitle-transcription-and-alignment",
+                music_file=Path(music_filename),
+                lyrics=lyrics,
+                music_digest=music_digest,
+            ),
+            run_in_thread_timed(translate_lines, japanese_texts=japanese_texts),
+        )
+        aligned_lyrics = correct_lyrics_timing(
+            original_lines=japanese_texts, aligned_lyrics=aligned_lyrics
+        )
+        translated_lyrics = add_translations(aligned_lyrics, translated_lines)
+
+        # 歌詞動画の生成処理を呼び出す
+        logger.info(f"[Request ID: {request_id}] 歌詞動画を生成しています...")
+        _, render_seconds = await run_in_thread_timed(
+            create_lyric_video,
+            music_file=music_filename,
+            image_file=image_filename,
+            lyrics=translated_lyrics,
+            output_file=video_filename,
+            font_name_ja=params.font_name_ja,
+            font_name_en=params.font_name_en,
+            font_color=params.font_color,
+            stroke_color=params.outline_color,
+            font_size=params.font_size,
+            stroke_width=params.outline_size,
+            margin_bottom=params.bottom_margin,
+            enable_fade=params.enable_fade,
+        )
+        logger.info(
+            f"[Request ID: {request_id}] 歌詞動画の生成が完了しました: {video_filename} "
+            f"(アラインメント: {align_seconds:.1f}秒, 翻訳: {translate_seconds:.1f}秒, "
+            f"動画生成: {render_seconds:.1f}秒)"
+        )
+
+        # 動画ファイルをレスポンスとして返す
+        # 一時ディレクトリは、レスポンスの送信が完了した後にバックグラウンドで削除する
+        return VideoFileResponse(
+            video_filename,
+            media_type="video/mp4",
+            filename=os.path.basename(video_filename),
+            background=BackgroundTask(shutil.rmtree, temp_dir_path, ignore_errors=True),
+        )
+
+    except Exception as e:
+        logger.error(
+            f"[Request ID: {request_id}] ビデオ作成中にエラーが発生しました。",
+            exc_info=True,
+        )
+        # エラーが発生した場合も、作成された一時ディレクトリをクリーンアップ
+        # 削除できなかったファイルは、古い一時ディレクトリの定期的な削除で削除される
+        shutil.rmtree(temp_dir_path, ignore_errors=True)
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+
+def main():
+    logger.info("FastAPIアプリケーションを起動します。")
+    logger.info("APIドキュメント: http://127.0.0.1:8000/docs")
+    # 開発中 (環境変数 DEV が設定されている場合) のみリロードを有効にする
+    reload = bool(os.getenv("DEV"))
+    # ワーカープロセスの数は、uvicorn が環境変数 WEB_CONCURRENCY から読み込む (既定値は 1)
+    # (アップロードファイルはリクエストごとのディレクトリに保存されるため、複数ワーカーでも安全)
+    # uvicorn.run に log_config を渡してロギング設定を適用
+    # (イベントループは uvloop がインストールされていれば自動的に使用される)
+    uvicorn.run(
+        "lyrics_video_creator.app:app",
+        host="127.0.0.1",
+        port=8000,
+        log_config=LOGGING_CONFIG,
+        reload=reload,
+    )
+
+
+if __name__ == "__main__":
+    main()
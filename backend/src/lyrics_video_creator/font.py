@@ -1,10 +1,50 @@
 import os
+import subprocess
 import sys
-import winreg
+from functools import lru_cache
 from pathlib import Path
 
+# winreg is only available on Windows
+if sys.platform == "win32":
+    import winreg
 
-def get_font_path(font_name: str) -> Path | None:
+# Path to the registry key where font information is stored
+FONT_REGISTRY_KEY_PATH = r"SOFTWARE\Microsoft\Windows NT\CurrentVersion\Fonts"
+
+
+@lru_cache(maxsize=1)
+def _load_font_registry() -> dict[str, str]:
+    """
+    Reads all the font entries from the Windows registry.
+
+    Returns:
+        A dictionary mapping the lowercased registry entry names (e.g., "arial (truetype)")
+        to the font file names (e.g., "arial.ttf"), in the order of the registry.
+    """
+    fonts: dict[str, str] = {}
+
+    # Open the registry key for reading.
+    # The 'with' statement ensures the key is automatically closed.
+    with winreg.OpenKey(
+        winreg.HKEY_LOCAL_MACHINE, FONT_REGISTRY_KEY_PATH, 0, winreg.KEY_READ
+    ) as key:
+        i = 0
+        while True:
+            try:
+                # Enumerate over the values in the registry key.
+                # Each font has a value name (e.g., "Arial (TrueType)") and value data (e.g., "arial.ttf").
+                value_name, file_name, value_type = winreg.EnumValue(key, i)
+            except OSError:
+                # This exception is raised when there are no more values to enumerate.
+                # It signals the end of the loop.
+                break
+            fonts[value_name.lower()] = file_name
+            i += 1
+
+    return fonts
+
+
+def _get_font_path_windows(font_name: str) -> Path | None:
     """
     Finds the absolute path of a font file on Windows given its name.
 
@@ -15,9 +55,6 @@ def get_font_path(font_name: str) -> Path | None:
     Returns:
         The absolute path to the font file if found, otherwise None.
     """
-    # Path to the registry key where font information is stored
-    font_registry_key_path = r"SOFTWARE\Microsoft\Windows NT\CurrentVersion\Fonts"
-
     # The default directory for fonts in Windows
     # We use os.environ['SystemRoot'] to get the path to the Windows directory (e.g., C:\Windows)
     fonts_dir = os.path.join(os.environ["SystemRoot"], "Fonts")
@@ -25,48 +62,105 @@ def get_font_path(font_name: str) -> Path | None:
     # The font name to search for, converted to lowercase for case-insensitive matching
     search_font_name = font_name.lower()
 
-    try:
-        # Open the registry key for reading.
-        # The 'with' statement ensures the key is automatically closed.
-        with winreg.OpenKey(
-            winreg.HKEY_LOCAL_MACHINE, font_registry_key_path, 0, winreg.KEY_READ
-        ) as key:
-            i = 0
-            while True:
-                try:
-                    # Enumerate over the values in the registry key.
-                    # Each font has a value name (e.g., "Arial (TrueType)") and value data (e.g., "arial.ttf").
-                    value_name, file_name, value_type = winreg.EnumValue(key, i)
-
-                    # Check if the desired font name is part of the registry entry's name.
-                    # This handles variations like "(TrueType)", "(Bold)", etc.
-                    if search_font_name in value_name.lower():
-                        # If a match is found, construct the full path to the font file.
-                        font_path = os.path.join(fonts_dir, file_name)
-
-                        # Verify that the file actually exists before returning the path.
-                        if os.path.exists(font_path):
-                            return Path(font_path)
-
-                    i += 1
-                except OSError:
-                    # This exception is raised when there are no more values to enumerate.
-                    # It signals the end of the loop.
-                    break
+    # Many fonts are installed under their own name (e.g., "Arial" -> "arial.ttf"),
+    # so try the font file directly before reading the registry.
+    for stem in dict.fromkeys([search_font_name, search_font_name.replace(" ", "")]):
+        for extension in (".ttf", ".otf", ".ttc"):
+            font_path = os.path.join(fonts_dir, stem + extension)
+            if os.path.exists(font_path):
+                return Path(font_path)
 
+    try:
+        # The registry is read only once, and the fonts are searched in memory afterwards
+        fonts = _load_font_registry()
     except FileNotFoundError:
         # This occurs if the registry key itself does not exist (very unlikely on a Windows system).
-        print(f"Error: Font registry key not found at '{font_registry_key_path}'")
+        print(f"Error: Font registry key not found at '{FONT_REGISTRY_KEY_PATH}'")
         return None
     except Exception as e:
         # Catch any other unexpected errors during registry access.
         print(f"An unexpected error occurred: {e}")
         return None
 
-    # If the loop completes without finding the font, return None.
+    # Most fonts are registered as "<name> (TrueType)", so try the exact entry first
+    file_name = fonts.get(f"{search_font_name} (truetype)")
+    if file_name is not None:
+        font_path = os.path.join(fonts_dir, file_name)
+        if os.path.exists(font_path):
+            return Path(font_path)
+
+    for value_name, file_name in fonts.items():
+        # Check if the desired font name is part of the registry entry's name.
+        # This handles variations like "(TrueType)", "(Bold)", etc.
+        if search_font_name in value_name:
+            # If a match is found, construct the full path to the font file.
+            font_path = os.path.join(fonts_dir, file_name)
+
+            # Verify that the file actually exists before returning the path.
+            if os.path.exists(font_path):
+                return Path(font_path)
+
+    # If no entry matches the font, return None.
     return None
 
 
+def _get_font_path_fontconfig(font_name: str) -> Path | None:
+    """
+    Finds the absolute path of a font file using fontconfig (Linux, macOS) given its name.
+
+    Args:
+        font_name: The name of the font to search for (e.g., "Noto Sans JP").
+                   The search is case-insensitive.
+
+    Returns:
+        The absolute path to the font file if found, otherwise None.
+    """
+    # Escape the characters which have a special meaning in fontconfig patterns
+    pattern = "".join("\\" + c if c in "\\-:," else c for c in font_name)
+
+    try:
+        result = subprocess.run(
+            ["fc-match", "--format=%{family}\n%{file}", pattern],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except FileNotFoundError:
+        print("Error: fc-match is not installed. Please install fontconfig.")
+        return None
+    except subprocess.CalledProcessError as e:
+        print(f"An unexpected error occurred: {e}")
+        return None
+
+    families, _, file_name = result.stdout.partition("\n")
+
+    # fc-match falls back to a default font if no font matches the name,
+    # so check that the matched font actually has the requested name.
+    if font_name.lower() not in families.lower() or not os.path.exists(file_name):
+        return None
+    return Path(file_name)
+
+
+# The fonts are looked up only once per font name, since the installed fonts
+# rarely change while the process is running.
+@lru_cache(maxsize=256)
+def get_font_path(font_name: str) -> Path | None:
+    """
+    Finds the absolute path of a font file given its name.
+    The Windows registry is used on Windows, and fontconfig is used on the other platforms.
+
+    Args:
+        font_name: The name of the font to search for (e.g., "Arial", "Meiryo UI").
+                   The search is case-insensitive.
+
+    Returns:
+        The absolute path to the font file if found, otherwise None.
+    """
+    if sys.platform == "win32":
+        return _get_font_path_windows(font_name)
+    return _get_font_path_fontconfig(font_name)
+
+
 if __name__ == "__main__":
     # --- Example Usage ---
 
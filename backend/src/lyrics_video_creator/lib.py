@@ -1,34 +1,162 @@
 import copy
-import json
+import hashlib
 import logging  # ...new import...
+import math
 import os
+import re
+import shutil
+import subprocess
 import tempfile
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, suppress
+from functools import cache, lru_cache, partial
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
+import numpy as np
+import orjson
 import requests
-
-# Import LangChain and OpenAI related libraries
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from moviepy import AudioFileClip, CompositeVideoClip, ImageClip, TextClip, vfx
-from musicai_sdk import MusicAiClient
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+from tenacity import (
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
 
 from lyrics_video_creator.font import get_font_path
 
+# LangChain, OpenAI and MoviePy are slow to import, so they are imported by the
+# functions which use them
+if TYPE_CHECKING:
+    import tiktoken
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.runnables import Runnable
+
 logger = logging.getLogger(__name__)
 
+# Number of lyric lines sent to the language model in a single request
+TRANSLATION_CHUNK_SIZE = 20
+# Maximum number of tokens of the lyrics sent to the language model in a single request
+TRANSLATION_MAX_CHUNK_TOKENS = 6000
+# Language model used for the translation
+TRANSLATION_MODEL = "gpt-4.1-mini"
+# Maximum number of translation requests sent concurrently
+TRANSLATION_MAX_CONCURRENCY = 4
+# Number of temperatures tried concurrently when retrying the lines which failed to translate
+TRANSLATION_RETRY_TEMPERATURES = 3
+# Minimum ratio of the lines of a chunk whose translation must be known for those
+# translations to be reused, so that only the other lines are translated
+TRANSLATION_LINE_REUSE_RATIO = 0.9
+# Directory where the intermediate results are cached
+CACHE_DIR = Path(
+    os.getenv(
+        "LYRICS_VIDEO_CREATOR_CACHE_DIR",
+        Path.home() / ".cache" / "lyrics-video-creator",
+    )
+)
+# The cache entries which have not been used for this many seconds (30 days) are removed
+CACHE_MAX_AGE = 30 * 24 * 60 * 60
+# Maximum number of entries kept in each cache directory. The least recently used
+# entries beyond it are removed.
+CACHE_MAX_ENTRIES = 20000
+# Seconds for which the URL of a file uploaded to MusicAI is reused. The lifetime of
+# the URLs is not documented, so they are only kept for a while, and a URL is
+# uploaded again if a job using it fails.
+MUSICAI_UPLOAD_CACHE_TTL = 60 * 60
+# Timeouts of the requests to MusicAI in seconds, (connect, read). The read timeout
+# is long enough for the upload of a music file, but a stalled request is retried.
+MUSICAI_REQUEST_TIMEOUT = (10, 300)
+# Duration of the fade-in and fade-out effects of the subtitles (in milliseconds)
+SUBTITLE_FADE_DURATION = 500
+# Audio codecs which are copied into the video as is, instead of being re-encoded to AAC
+COPYABLE_AUDIO_CODECS = {"aac"}
+# Hardware H.264 encoders in the order of preference, with their ffmpeg arguments.
+# All of them target a constant quality rather than a bitrate, so that the mostly
+# static frames of a lyric video are encoded into a small file.
+HARDWARE_ENCODER_ARGS = {
+    "h264_nvenc": [
+        "-preset",
+        "p4",
+        "-tune",
+        "hq",
+        "-rc",
+        "vbr",
+        "-cq",
+        "23",
+        # Without a bitrate, the quality is not capped by the default target bitrate
+        "-b:v",
+        "0",
+    ],
+    "h264_qsv": ["-preset", "veryfast", "-global_quality", "23"],
+    "h264_amf": ["-quality", "speed", "-rc", "cqp", "-qp_i", "23", "-qp_p", "23"],
+    "h264_videotoolbox": ["-q:v", "60"],
+}
+# Status code in the message of the HTTPError raised by the MusicAI SDK,
+# e.g. "Error getting job: 503 Service Unavailable"
+MUSICAI_ERROR_STATUS_PATTERN = re.compile(r": (\d{3})\b")
+
+
+def _is_transient_musicai_error(error: BaseException) -> bool:
+    """
+    Returns whether a request to the MusicAI API failed for a reason worth retrying:
+    a connection problem, rate limiting or a server error.
+    """
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if not isinstance(error, requests.HTTPError):
+        return False
+
+    if error.response is not None:
+        status_code = error.response.status_code
+    else:
+        # The SDK raises HTTPError without the response, with the status code only in
+        # the message (the format is pinned by tests/test_lib.py)
+        match = MUSICAI_ERROR_STATUS_PATTERN.search(str(error))
+        if match is None:
+            return False
+        status_code = int(match.group(1))
+    return status_code == 429 or 500 <= status_code < 600
+
+
+# Retries the idempotent requests to the MusicAI API. Jobs are not created with it,
+# since retrying a request which actually succeeded would run the job twice.
+_retry_musicai_request = retry(
+    retry=retry_if_exception(_is_transient_musicai_error),
+    stop=stop_after_attempt(5),
+    wait=wait_exponential_jitter(initial=1, max=30),
+    reraise=True,
+)
+
+
+class MusicAiJobError(RuntimeError):
+    """Raised when a MusicAI job fails."""
+
 
 class MusicAiJobRunner:
     """A class to run a job using the MusicAI API."""
 
-    def __init__(self, api_key: str, job_monitor_interval: int = 2):
+    def __init__(
+        self,
+        api_key: str,
+        job_monitor_interval: float = 1.0,
+        max_job_monitor_interval: float = 10.0,
+        max_job_duration: float = 30 * 60,
+    ):
+        # Import here since musicai_sdk is only needed when the alignment is not cached
+        from musicai_sdk import MusicAiClient
+
         self.client = MusicAiClient(
-            api_key=api_key, job_monitor_interval=job_monitor_interval
+            api_key=api_key,
+            job_monitor_interval=job_monitor_interval,
+            timeout=MUSICAI_REQUEST_TIMEOUT,
         )
+        self.max_job_monitor_interval = max_job_monitor_interval
+        self.max_job_duration = max_job_duration
 
+    @_retry_musicai_request
     def get_application_info(self) -> dict:
         """
         Gets application info from the MusicAI API.
@@ -36,6 +164,7 @@ class MusicAiJobRunner:
         app_info = self.client.get_application_info()
         return app_info
 
+    @_retry_musicai_request
     def upload_file(self, file_path: str | Path) -> str:
         """
         Uploads a file to the MusicAI API.
@@ -44,9 +173,45 @@ class MusicAiJobRunner:
         logger.info("File Uploaded: %s", file_url)
         return file_url
 
+    @_retry_musicai_request
+    def get_job(self, job_id: str) -> dict:
+        """
+        Gets the job info, including its status and result.
+        """
+        return self.client.get_job(job_id=job_id)
+
+    def wait_for_job_completion(self, job_id: str) -> dict:
+        """
+        Waits for a job to complete and returns the job info.
+
+        The job status is polled with an exponential backoff, so that short jobs are
+        detected quickly and long jobs do not issue many requests. The whole job info
+        is polled, so that no extra request is needed once the job has completed.
+
+        Raises:
+            TimeoutError: If the job does not complete within max_job_duration seconds.
+        """
+        deadline = time.monotonic() + self.max_job_duration
+        interval = self.client.job_monitor_interval
+        while True:
+            time.sleep(interval)
+            job_info = self.get_job(job_id)
+            if job_info["status"] in ("SUCCEEDED", "FAILED"):
+                return job_info
+            if time.monotonic() >= deadline:
+                raise TimeoutError(
+                    f"MusicAI job {job_id} did not complete within "
+                    f"{self.max_job_duration:g} seconds (status: {job_info['status']})."
+                )
+            interval = min(interval * 1.5, self.max_job_monitor_interval)
+
     def run_job(self, workflow_slug: str, workflow_params: dict[str, Any]) -> dict:
         """
         Runs a job using the MusicAI API.
+
+        Raises:
+            MusicAiJobError: If the job fails.
+            TimeoutError: If the job does not complete in time.
         """
         # Create a job for the workflow
         create_job_info = self.client.add_job(
@@ -58,248 +223,1060 @@ class MusicAiJobRunner:
         logger.info("Job Created: %s", job_id)
 
         # Wait for the job to complete
-        job_info = self.client.wait_for_job_completion(job_id)
-
-        # Get job info
-        job_info = self.client.get_job(job_id=job_id)
+        job_info = self.wait_for_job_completion(job_id)
+        if job_info["status"] == "FAILED":
+            raise MusicAiJobError(
+                f"MusicAI job {job_id} failed: {job_info.get('error')}"
+            )
 
         logger.info("Job Result: %s", job_info["result"])
         return job_info["result"]
 
 
+def split_lyrics_lines(lyrics: str) -> list[str]:
+    """
+    Splits lyrics into lines, stripping them and skipping empty lines.
+    """
+    return [text for line in lyrics.splitlines() if (text := line.strip())]
+
+
 def convert_lyrics_to_json(lyrics: str) -> list[dict]:
     """
     Converts lyrics to JSON format.
     """
-    lyrics_lines = [line.strip() for line in lyrics.splitlines()]
-    lyrics_lines = [line for line in lyrics_lines if line]
-    return [{"text": line, "language": "japanese"} for line in lyrics_lines]
+    return [
+        {"text": text, "language": "japanese"} for text in split_lyrics_lines(lyrics)
+    ]
 
 
-def align_lyrics(workflow_slug: str, music_file: Path, lyrics: str) -> list[dict]:
+def _write_cache_file(path: Path, data: bytes) -> None:
     """
-    Aligns lyrics to music using the MusicAI API.
+    Writes a cache entry atomically, creating the cache directory if needed.
+    Failing to write the entry only logs a warning, since the result which is being
+    cached is still valid and can be computed again.
     """
-    # # test
-    # lyrics_json = convert_lyrics_to_json(lyrics)
-    # for i, lyric in enumerate(lyrics_json):
-    #     lyric["start"] = i * 4
-    #     lyric["end"] = i * 4 + 1
+    temp_path = None
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
 
-    # return lyrics_json
+        # Write into a temporary file first so that a partially written entry is never read
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.warning("Failed to write the cache file '%s' - %s", path, e)
+        if temp_path is not None:
+            with suppress(OSError):
+                os.remove(temp_path)
 
-    # Initialize the MusicAI client
-    musicai = MusicAiJobRunner(api_key=os.environ["MUSICAI_API_KEY"])
 
-    # Get application info
-    app_info = musicai.get_application_info()
-    logger.info("MusicAI Application Info: %s", app_info)
+def _read_cache_file(path: Path) -> bytes | None:
+    """
+    Reads a cache entry, or returns None if it is not cached.
+    The modification time of the entry is updated, so that prune_cache() removes the
+    least recently used entries first.
+    """
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    with suppress(OSError):
+        os.utime(path)
+    return data
 
-    # with NamedTemporaryFile(mode="w+", suffix=".json") as temp_lyrics_file:
-    #     # convert the lyrics to json
-    #     lyrics_json = convert_lyrics_to_json(lyrics)
-    #     temp_lyrics_file.write(
-    #         json.dumps(lyrics_json, ensure_ascii=False)
-    #     )
-    #     temp_lyrics_file.flush()
 
-    lyrics_json = convert_lyrics_to_json(lyrics)
-    temp_lyrics_file = Path(tempfile.mkstemp(suffix=".json", text=True)[1])
-    temp_lyrics_file.write_text(
-        json.dumps(lyrics_json, ensure_ascii=False), encoding="utf-8"
+def prune_cache() -> None:
+    """
+    Removes the cache entries which have not been used for CACHE_MAX_AGE seconds, and
+    the least recently used entries beyond CACHE_MAX_ENTRIES in each cache directory.
+    """
+    if not CACHE_DIR.is_dir():
+        return
+
+    threshold = time.time() - CACHE_MAX_AGE
+    for directory in CACHE_DIR.iterdir():
+        if not directory.is_dir():
+            continue
+
+        # Another process may remove the entries at the same time, so the entries
+        # which cannot be inspected or removed are skipped
+        entries = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                with suppress(OSError):
+                    if entry.is_file():
+                        entries.append((entry.stat().st_mtime, entry.path))
+        entries.sort(reverse=True)
+
+        num_removed = 0
+        for i, (mtime, path) in enumerate(entries):
+            if i >= CACHE_MAX_ENTRIES or mtime < threshold:
+                with suppress(OSError):
+                    os.remove(path)
+                    num_removed += 1
+        if num_removed:
+            logger.info(
+                "Removed %d entries from the cache '%s'.", num_removed, directory
+            )
+
+
+def _file_digest(file_path: str | Path) -> str:
+    """
+    Computes the BLAKE2b digest of the contents of a file.
+    """
+    digest = hashlib.blake2b()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _alignment_cache_key(workflow_slug: str, music_digest: str, lyrics: str) -> str:
+    """
+    Builds the cache key of an alignment result from everything that affects it.
+    """
+    payload = orjson.dumps(
+        {"workflow": workflow_slug, "music": music_digest, "lyrics": lyrics},
+        option=orjson.OPT_SORT_KEYS,
+    )
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _load_cached_alignment(key: str) -> list[dict] | None:
+    """
+    Loads a cached alignment result, or returns None if it is not cached.
+    """
+    data = _read_cache_file(CACHE_DIR / "align" / f"{key}.json")
+    return None if data is None else orjson.loads(data)
+
+
+def _store_cached_alignment(key: str, aligned_lyrics: list[dict]) -> None:
+    """
+    Stores an alignment result into the cache.
+    """
+    _write_cache_file(CACHE_DIR / "align" / f"{key}.json", orjson.dumps(aligned_lyrics))
+
+
+def _load_cached_upload(file_digest: str) -> str | None:
+    """
+    Returns the URL of a file uploaded to MusicAI recently, or None if it is not cached
+    or may have expired. An expired entry is removed.
+    """
+    path = CACHE_DIR / "upload" / f"{file_digest}.txt"
+    try:
+        if time.time() - path.stat().st_mtime > MUSICAI_UPLOAD_CACHE_TTL:
+            _remove_cached_upload(file_digest)
+            return None
+        return path.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+
+
+def _store_cached_upload(file_digest: str, file_url: str) -> None:
+    """
+    Stores the URL of a file uploaded to MusicAI into the cache.
+    """
+    _write_cache_file(
+        CACHE_DIR / "upload" / f"{file_digest}.txt", file_url.encode("utf-8")
     )
 
-    # Upload the files
-    music_url = musicai.upload_file(music_file)
-    lyrics_url = musicai.upload_file(str(temp_lyrics_file))
 
-    # Define workflow parameters
-    workflow_params = {
-        "musicUrl": music_url,
-        "lyricsUrl": lyrics_url,
-    }
+def _remove_cached_upload(file_digest: str) -> None:
+    """
+    Removes the URL of a file uploaded to MusicAI from the cache.
+    """
+    with suppress(OSError):
+        os.remove(CACHE_DIR / "upload" / f"{file_digest}.txt")
+
+
+def align_lyrics(
+    workflow_slug: str,
+    music_file: Path,
+    lyrics: str,
+    music_digest: str | None = None,
+) -> list[dict]:
+    """
+    Aligns lyrics to music using the MusicAI API.
+    The result is cached, so the same music and lyrics are aligned only once.
+
+    Args:
+        workflow_slug (str): Slug of the MusicAI workflow.
+        music_file (Path): Path to the music file.
+        lyrics (str): Lyrics separated by newlines.
+        music_digest (str | None): Digest of the music file, if it was computed while
+            saving the file. It is computed from the file if omitted.
+    """
+    if music_digest is None:
+        music_digest = _file_digest(music_file)
+    cache_key = _alignment_cache_key(workflow_slug, music_digest, lyrics)
+    cached_alignment = _load_cached_alignment(cache_key)
+    if cached_alignment is not None:
+        logger.info("Using cached alignment result.")
+        return cached_alignment
+
+    # Initialize the MusicAI client
+    musicai = MusicAiJobRunner(api_key=os.environ["MUSICAI_API_KEY"])
+
+    lyrics_json = convert_lyrics_to_json(lyrics)
+    fd, temp_lyrics_file = tempfile.mkstemp(suffix=".json")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps(lyrics_json))
+
+        # Upload the files concurrently, since the upload of the music file dominates.
+        # The application info is fetched in the meantime too.
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            app_info_future = executor.submit(musicai.get_application_info)
+            # The same music may be aligned with different lyrics, so the upload
+            # of the music file is reused for a while
+            music_url = _load_cached_upload(music_digest)
+            music_url_cached = music_url is not None
+            if music_url is None:
+                music_future = executor.submit(musicai.upload_file, music_file)
+            lyrics_future = executor.submit(musicai.upload_file, temp_lyrics_file)
+            if music_url is None:
+                music_url = music_future.result()
+                _store_cached_upload(music_digest, music_url)
+            lyrics_url = lyrics_future.result()
+            logger.info("MusicAI Application Info: %s", app_info_future.result())
+    finally:
+        os.remove(temp_lyrics_file)
 
     # Create a job for the workflow
-    job_result = musicai.run_job(workflow_slug, workflow_params)
+    try:
+        job_result = musicai.run_job(
+            workflow_slug, {"musicUrl": music_url, "lyricsUrl": lyrics_url}
+        )
+    except MusicAiJobError:
+        if not music_url_cached:
+            raise
+        # The cached URL of the music file may no longer be valid, so the music file
+        # is uploaded again and the job is retried once
+        logger.warning("The job failed with the cached music URL. Retrying...")
+        _remove_cached_upload(music_digest)
+        music_url = musicai.upload_file(music_file)
+        _store_cached_upload(music_digest, music_url)
+        job_result = musicai.run_job(
+            workflow_slug, {"musicUrl": music_url, "lyricsUrl": lyrics_url}
+        )
     logger.info("Job Result: %s", job_result)
 
     # fetch result from the job
     url = job_result["transcription + syllable alignment"]
-    response = requests.get(url)
-    aligned_lyrics = json.loads(response.text)
+    response = requests.get(url, timeout=MUSICAI_REQUEST_TIMEOUT)
+    response.raise_for_status()
+    aligned_lyrics = orjson.loads(response.content)
 
+    _store_cached_alignment(cache_key, aligned_lyrics)
     return aligned_lyrics
 
 
 def correct_lyrics_timing(
-    original_lyrics: str, aligned_lyrics: list[dict]
+    original_lines: list[str], aligned_lyrics: list[dict]
 ) -> list[dict]:
     """
     Corrects the timing of the aligned lyrics based on the original lyrics.
+
+    Args:
+        original_lines (list[str]): Lines of the original lyrics, as returned by
+            split_lyrics_lines().
+        aligned_lyrics (list[dict]): Lyrics aligned by align_lyrics().
     """
-    # Format the original lyrics as JSON
-    original_lyrics_json = convert_lyrics_to_json(original_lyrics)
+    if len(aligned_lyrics) != len(original_lines):
+        logger.warning(
+            "The number of aligned lines (%d) does not match the number of lyric lines (%d).",
+            len(aligned_lyrics),
+            len(original_lines),
+        )
     aligned_lyrics = copy.copy(aligned_lyrics)
 
-    for i in range(len(aligned_lyrics) - 1):
-        # Replace the text in the aligned lyrics with the original lyrics
-        aligned_lyrics[i]["text"] = original_lyrics_json[i]["text"]
-        # Fix the start and end times of the aligned lyrics
-        aligned_lyrics[i]["end"] = min(
-            aligned_lyrics[i]["end"] + 1.0, aligned_lyrics[i + 1]["start"]
-        )
+    # Extend each line by 1 second, but not beyond the start of the next line
+    starts = np.fromiter(
+        (lyric["start"] for lyric in aligned_lyrics),
+        dtype=np.float64,
+        count=len(aligned_lyrics),
+    )
+    ends = np.fromiter(
+        (lyric["end"] for lyric in aligned_lyrics),
+        dtype=np.float64,
+        count=len(aligned_lyrics),
+    )
+    new_ends = np.minimum(ends[:-1] + 1.0, starts[1:])
+
+    for i, end in enumerate(new_ends.tolist()):
+        # Fix the end time of the aligned lyrics
+        aligned_lyrics[i]["end"] = end
+
+    # Replace the text in the aligned lyrics with the original lyrics.
+    # The lines are paired by their index, in the same way as the translations of the
+    # original lines are paired with the aligned lyrics by add_translations().
+    for lyric, text in zip(aligned_lyrics, original_lines):
+        lyric["text"] = text
     return aligned_lyrics
 
 
-def translate_lyrics(lyrics: list[dict]) -> list[dict]:
+def _translation_cache_key(
+    model_name: str, prompt_template: str, lyrics_block: str
+) -> str:
     """
-    Reads a Japanese lyrics JSON file, translates it into English, and saves it to a new JSON file.
+    Computes the cache key of the translation of a chunk.
+    The temperature is not part of the key, since any accepted translation can be reused.
+    """
+    payload = orjson.dumps(
+        {
+            "model": model_name,
+            "seed": 42,
+            "prompt": prompt_template,
+            "lyrics": lyrics_block,
+        },
+        option=orjson.OPT_SORT_KEYS,
+    )
+    return hashlib.sha256(payload).hexdigest()
 
-    Args:
-        input_file_path (str): Path to the input JSON file.
-        output_file_path (str): Path to the output JSON file.
+
+def _load_cached_translation(key: str) -> list[str] | None:
     """
-    # Check OpenAI API key
-    api_key = os.getenv("OPENAI_API_KEY")
-    if api_key is None:
-        raise RuntimeError(
-            "Error: Environment variable OPENAI_API_KEY is not set. "
-            "Please set OPENAI_API_KEY before running the script."
-            "Example: export OPENAI_API_KEY='your_api_key_here'"
-        )
+    Loads the cached translation of a chunk, or returns None if it is not cached.
+    """
+    data = _read_cache_file(CACHE_DIR / "translate" / f"{key}.json")
+    return None if data is None else orjson.loads(data)
 
-    # Check input data format
-    if not isinstance(lyrics, list):
-        logger.error(
-            "Error: The content of input file '%s' must be a list.", input_file_path
-        )
-        return
-    if not all(
-        isinstance(item, dict) and "text" in item and "start" in item and "end" in item
-        for item in lyrics
-    ):
-        raise RuntimeError(
-            "Error: Each element in the input file must be a dictionary with 'text', 'start', and 'end' keys."
+
+def _store_cached_translation(key: str, translated_lines: list[str]) -> None:
+    """
+    Stores the accepted translation of a chunk into the cache.
+    """
+    _write_cache_file(
+        CACHE_DIR / "translate" / f"{key}.json", orjson.dumps(translated_lines)
+    )
+
+
+def _load_cached_line_translations(lines: list[str]) -> dict[int, str]:
+    """
+    Loads the cached translations of single lines.
+
+    Returns:
+        The translation of each line which is cached, keyed by its 1-based line number.
+    """
+    translations = {}
+    for n, line in enumerate(lines, start=1):
+        key = _translation_cache_key(TRANSLATION_MODEL, TRANSLATION_PROMPT, line)
+        data = _read_cache_file(CACHE_DIR / "translate_line" / f"{key}.json")
+        if data is not None:
+            translations[n] = orjson.loads(data)
+    return translations
+
+
+def _store_cached_line_translations(
+    lines: list[str], translated_lines: list[str]
+) -> None:
+    """
+    Stores the translation of each line of an accepted chunk into the cache.
+    """
+    for line, translated_line in zip(lines, translated_lines):
+        key = _translation_cache_key(TRANSLATION_MODEL, TRANSLATION_PROMPT, line)
+        _write_cache_file(
+            CACHE_DIR / "translate_line" / f"{key}.json",
+            orjson.dumps(translated_line),
         )
 
-    japanese_texts = [item["text"] for item in lyrics]
-    num_original_lines = len(japanese_texts)
-    japanese_lyrics_block = "\n".join(japanese_texts)
 
-    # Create prompt
-    # Hint: Include the entire lyrics in the prompt and specify the output format in the prompt
-    #       to make it easier to extract the English lyrics accurately.
-    prompt_template_str = """\
-以下の日本語の歌詞を英語に翻訳してください。
-各行の翻訳は改行で区切って、元の歌詞の行数と全く同じ数の翻訳行を生成してください。
-翻訳は自然で、歌詞としての流れを意識してください。
+@lru_cache(maxsize=1)
+def _get_token_encoding() -> "tiktoken.Encoding | None":
+    """
+    Loads the tokenizer of the translation model, or returns None if it is not available.
+    The encoding is downloaded on first use, so loading it is tried only once per process
+    rather than stalling every translation when the download is not reachable.
+    """
+    import tiktoken
+
+    try:
+        # o200k_base is the encoding of the gpt-4o and gpt-4.1 model families
+        return tiktoken.get_encoding("o200k_base")
+    except (requests.RequestException, OSError, ValueError) as e:
+        logger.warning("Failed to load the tokenizer, counting characters - %s", e)
+        return None
 
-# 歌詞
 
-<lyrics>
-{lyrics}
-</lyrics>
+def _count_tokens(lines: list[str]) -> list[int]:
+    """
+    Counts the number of tokens of each line.
+    """
+    encoding = _get_token_encoding()
+    if encoding is None:
+        # Count the characters instead, which is not less than the number of tokens
+        # for Japanese text
+        return [len(line) for line in lines]
+    return [len(tokens) for tokens in encoding.encode_batch(lines)]
+
+
+def _split_into_chunks(lines: list[str]) -> list[list[str]]:
+    """
+    Splits lyric lines into chunks of at most TRANSLATION_CHUNK_SIZE lines.
+    The chunks are the unit of the translation cache, so they only depend on the lines.
+    """
+    return [
+        lines[i : i + TRANSLATION_CHUNK_SIZE]
+        for i in range(0, len(lines), TRANSLATION_CHUNK_SIZE)
+    ]
+
+
+def _split_by_tokens(
+    numbered_lines: list[tuple[int, str]],
+) -> list[list[tuple[int, str]]]:
+    """
+    Splits the numbered lines of a chunk which are sent to the language model into
+    groups of at most TRANSLATION_MAX_CHUNK_TOKENS tokens, so that no request exceeds
+    the context window. The tokens are only counted for the lines which are sent.
+    """
+    groups: list[list[tuple[int, str]]] = []
+    group: list[tuple[int, str]] = []
+    group_tokens = 0
+    num_tokens_list = _count_tokens([line for _, line in numbered_lines])
+    for numbered_line, num_tokens in zip(numbered_lines, num_tokens_list):
+        # Count the line number prefix and the newline as well
+        line_tokens = num_tokens + 2
+        if group and group_tokens + line_tokens > TRANSLATION_MAX_CHUNK_TOKENS:
+            groups.append(group)
+            group = []
+            group_tokens = 0
+        group.append(numbered_line)
+        group_tokens += line_tokens
+
+    if group:
+        groups.append(group)
+    return groups
+
+
+# A line of the translation response, "<line number>|<translation>"
+TRANSLATION_LINE_PATTERN = re.compile(
+    r"^[^\S\n]*(\d+)[^\S\n]*\|[^\S\n]*(.*?)[^\S\n]*$", re.MULTILINE
+)
+
+
+def _parse_translation_response(response_text: str) -> dict[int, str]:
+    """
+    Extracts the translated lines from the response of the language model.
+    Each line of the response is expected to be "<line number>|<translation>".
+
+    Returns:
+        A dictionary mapping the line numbers (starting from 1) to the translations.
+        Lines which do not follow the output format are skipped.
+    """
+    translations: dict[int, str] = {}
+    for match in TRANSLATION_LINE_PATTERN.finditer(response_text):
+        number, text = match.groups()
+        if text:
+            # Keep the first translation if the model repeats a line number
+            translations.setdefault(int(number), text)
+    return translations
+
+
+def _stream_translation(chat_model: "Runnable", inputs: dict[str, Any]) -> str:
+    """
+    Streams the translation of a chunk and stops the generation as soon as the response
+    drifts from the output format or runs past the last line of the chunk.
+
+    Args:
+        chat_model (Runnable): Chat model which translates the lyrics.
+        inputs (dict): "lyrics" is the numbered lyrics block, "last_line_number" is
+            the number of its last line and "temperature" is the sampling temperature.
+
+    Returns:
+        The response text received until the generation was stopped.
+    """
+    last_line_number = inputs["last_line_number"]
+    received_lines: list[str] = []
+    buffer = ""
+
+    # The message chunks are read without an output parser, since closing a stream
+    # which ends with a parser makes langchain consume the rest of the model output
+    chain = _get_translation_prompt() | chat_model.bind(
+        temperature=inputs["temperature"]
+    )
+
+    # Closing the stream closes the HTTP connection, which cancels the generation on the server
+    with closing(chain.stream({"lyrics": inputs["lyrics"]})) as stream:
+        for chunk in stream:
+            buffer += chunk.content
+            *completed_lines, buffer = buffer.split("\n")
+            for line in completed_lines:
+                number, sep, _ = line.partition("|")
+                number = number.strip()
+                if sep and number.isdecimal():
+                    if int(number) > last_line_number:
+                        logger.debug("  Stopped the translation at line %s.", number)
+                        return "\n".join(received_lines)
+                    received_lines.append(line)
+                    if int(number) == last_line_number:
+                        return "\n".join(received_lines)
+                elif received_lines and line.strip() and not line.startswith("```"):
+                    # The model no longer follows the output format after the translation started
+                    logger.debug("  Stopped the translation at a malformed line.")
+                    return "\n".join(received_lines)
+
+    received_lines.append(buffer)
+    return "\n".join(received_lines)
+
+
+# Instructions of the translation, sent as the system message
+# Hint: Include the entire lyrics in the prompt and specify the output format in the prompt
+#       to make it easier to extract the English lyrics accurately.
+# The instructions are kept free of variables and placed before the lyrics, so that
+# every request shares the same prefix and the provider can reuse its prompt cache.
+TRANSLATION_PROMPT = """\
+<lyrics>タグで囲まれた日本語の歌詞を英語に翻訳してください。
+歌詞の各行には「行番号|歌詞」の形式で行番号が付いています。
+各行の翻訳は改行で区切って、元の歌詞の行数と全く同じ数の翻訳行を生成してください。
+翻訳は自然で、歌詞としての流れを意識してください。
 
 # 条件
 
 * もとの歌詞の意味合いと雰囲気を可能な限り維持してください
 * 翻訳された各行は、元の日本語の歌詞の各行に厳密に対応する必要があります。
+* 翻訳された各行の先頭には、対応する元の歌詞の行番号を付けてください。
 * 空の行や不必要な空白行を生成しないでください。元の行数と完全に一致させてください。
-* もとの歌詞と翻訳結果以外は一切出力しないでください。
+* 行番号と翻訳結果以外は一切出力しないでください。
 * 前置き、後書き、元の日本語歌詞、追加のコメントや説明は一切含めないでください。
 * 下記の出力形式に厳密に従ってください。
 
 # 出力形式
 
 ```
-[日本語歌詞の1行目],[1行目の翻訳結果]
-[日本語歌詞の2行目],[2行目の翻訳結果]
+1|[1行目の翻訳結果]
+2|[2行目の翻訳結果]
 (以降同様に続く)
 ```
 """
 
-    current_temperature = 0.0
+
+@lru_cache(maxsize=1)
+def _get_translation_prompt() -> "ChatPromptTemplate":
+    """
+    Returns the prompt of the translation, which is parsed once and shared by all the
+    translations.
+    """
+    from langchain_core.prompts import ChatPromptTemplate
+
+    return ChatPromptTemplate.from_messages(
+        [
+            ("system", TRANSLATION_PROMPT),
+            ("human", "<lyrics>\n{lyrics}\n</lyrics>"),
+        ]
+    )
+
+
+@lru_cache(maxsize=1)
+def _get_chat_model() -> "Runnable":
+    """
+    Returns the chat model used for the translation.
+
+    The model is created once, so that its HTTP connections are reused by all the
+    translations. The temperature is bound for each attempt.
+    """
+    # Import here since langchain_openai is slow to import and is only needed
+    # when some chunks have to be translated
+    from langchain_openai import ChatOpenAI
+
+    # Condition: Set temperature parameter of ChatOpenAI to 0 and seed to 42.
+    # (First try with temperature=0, increase temperature on retry)
+    return ChatOpenAI(
+        temperature=0.0,
+        model=TRANSLATION_MODEL,
+        timeout=120,  # Set a longer timeout
+        seed=42,  # Seed value to improve reproducibility of model output
+    )
+
+
+def translate_lines(japanese_texts: list[str]) -> list[str]:
+    """
+    Translates Japanese lyric lines into English.
+    Only the text is needed, so this can run while the lyrics are being aligned.
+
+    Args:
+        japanese_texts (list[str]): Japanese lyric lines.
+
+    Returns:
+        The English translation of each line, in the same order.
+    """
+    num_original_lines = len(japanese_texts)
+
+    # Split the lyrics into chunks so that they can be translated concurrently
+    chunks = _split_into_chunks(japanese_texts)
+
+    # Number each line so that the translations can be matched with the original lines
+    chunk_blocks = [
+        "\n".join(f"{n}|{line}" for n, line in enumerate(chunk, start=1))
+        for chunk in chunks
+    ]
+
+    # Reuse the translations of the chunks which have been translated before,
+    # so that the language model is only called for the new chunks
+    cache_keys = [
+        _translation_cache_key(TRANSLATION_MODEL, TRANSLATION_PROMPT, block)
+        for block in chunk_blocks
+    ]
+    translated_chunks: list[list[str] | None] = [
+        _load_cached_translation(key) for key in cache_keys
+    ]
+
+    # Lines translated so far for each chunk which is not cached, keyed by the line number.
+    # The translations of single lines are reused for the chunks which are mostly
+    # unchanged (e.g. the same song with a few lines edited), so that only the changed
+    # lines are translated. Other chunks are translated as a whole to keep the context.
+    partial_translations: dict[int, dict[int, str]] = {}
+    for i, lines in enumerate(translated_chunks):
+        if lines is not None:
+            continue
+        known_translations = _load_cached_line_translations(chunks[i])
+        if len(known_translations) < TRANSLATION_LINE_REUSE_RATIO * len(chunks[i]):
+            known_translations = {}
+        elif known_translations:
+            logger.debug(
+                "  Reusing the translation of %d of %d line(s) of chunk %d.",
+                len(known_translations),
+                len(chunks[i]),
+                i,
+            )
+
+        if len(known_translations) == len(chunks[i]):
+            translated_chunks[i] = [
+                known_translations[n] for n in range(1, len(chunks[i]) + 1)
+            ]
+            _store_cached_translation(cache_keys[i], translated_chunks[i])
+        else:
+            partial_translations[i] = known_translations
+
+    num_cached_chunks = len(chunks) - len(partial_translations)
+    if not partial_translations:
+        logger.info("Using cached translation of all %d chunk(s).", len(chunks))
+        return [line for lines in translated_chunks for line in lines]
+
+    # Check OpenAI API key (only needed when some lines are not cached)
+    api_key = os.getenv("OPENAI_API_KEY")
+    if api_key is None:
+        raise RuntimeError(
+            "Error: Environment variable OPENAI_API_KEY is not set. "
+            "Please set OPENAI_API_KEY before running the script."
+            "Example: export OPENAI_API_KEY='your_api_key_here'"
+        )
+
+    min_temperature = 0.0
     # Hint: If the output does not follow the instructions, increase the value of temperature by 0.2
     #       and retry translation until the correct result is obtained.
     #       Here, try up to a maximum of 1.0.
     max_temperature = 1.0
     temperature_step = 0.2
-    translated_lines_list: list[str] = []
 
-    logger.info("Starting translation. Number of input lines: %d", len(japanese_texts))
+    logger.info(
+        "Starting translation. Number of input lines: %d, Number of chunks: %d (cached: %d)",
+        num_original_lines,
+        len(chunks),
+        num_cached_chunks,
+    )
 
-    # Translation using ChatOpenAI (including retry logic)
-    while current_temperature <= max_temperature:
-        logger.debug(
-            "  Trying translation with temperature %.1f...", current_temperature
+    # Temperatures of the attempts, in the order they are tried
+    temperatures = [
+        round(min_temperature + temperature_step * n, 1)
+        for n in range(
+            round((max_temperature - min_temperature) / temperature_step) + 1
         )
+    ]
+
+    # The response is streamed so that a malformed or runaway generation can be
+    # stopped early. Transient errors (rate limits, timeouts, server errors) are
+    # retried with exponential backoff and jitter, without raising the temperature.
+    import openai
+    from langchain_core.runnables import RunnableLambda
+
+    translator = RunnableLambda(
+        partial(_stream_translation, _get_chat_model())
+    ).with_retry(
+        retry_if_exception_type=(
+            openai.RateLimitError,
+            openai.APIConnectionError,  # includes openai.APITimeoutError
+            openai.InternalServerError,
+        ),
+        wait_exponential_jitter=True,
+        stop_after_attempt=5,
+    )
 
-        # Initialize ChatOpenAI
-        # Condition: Set temperature parameter of ChatOpenAI to 0 and seed to 42.
-        # (First try with temperature=0, increase temperature on retry)
-        chat_model = ChatOpenAI(
-            temperature=current_temperature,
-            name="gpt-4.1-mini",
-            timeout=120,  # Set a longer timeout
-            seed=42,  # Seed value to improve reproducibility of model output
-        )
+    # Translation using ChatOpenAI (including retry logic)
+    next_temperature = 0
+    while next_temperature < len(temperatures):
+        # Only the chunks which have not been translated successfully are sent again
+        pending = [i for i, lines in enumerate(translated_chunks) if lines is None]
+        if not pending:
+            break
 
-        prompt = ChatPromptTemplate.from_template(prompt_template_str)
-        chain = prompt | chat_model | StrOutputParser()
-
-        # To maintain consistency of lyrics, call ChatOpenAI once for the whole lyrics, not line by line
-        response_text = chain.invoke({"lyrics": japanese_lyrics_block})
-        response_text = response_text.replace("```", "")
-
-        # Parse and validate translation result
-        # Remove leading/trailing whitespace/newlines with strip(), then split by newline
-        potential_translations = response_text.strip().split("\n")
-        # Further strip each line
-        potential_translations = [line.strip() for line in potential_translations]
-        # Skip empty lines
-        potential_translations = [line for line in potential_translations if line]
-        # Split each line by comma and extract the translation part
-        potential_translations = [
-            ",".join(line.split(",")[1:]).strip() for line in potential_translations
+        # The first attempt uses only the lowest temperature. The lines which failed
+        # are retried with several temperatures concurrently rather than one after
+        # another, and the translation with the lowest temperature is kept.
+        num_temperatures = (
+            1 if next_temperature == 0 else TRANSLATION_RETRY_TEMPERATURES
+        )
+        attempt_temperatures = temperatures[
+            next_temperature : next_temperature + num_temperatures
         ]
+        next_temperature += len(attempt_temperatures)
 
-        # If the number of lines matches, break the loop
-        if len(potential_translations) == num_original_lines:
-            translated_lines_list = potential_translations
-            break
-
-        # If the number of lines does not match, increase temperature and retry
         logger.debug(
-            "  The number of translation lines (%.1f) did not match. Expected: %d, Actual: %d",
-            current_temperature,
-            num_original_lines,
-            len(potential_translations),
+            "  Trying translation of %d chunk(s) with temperature(s) %s...",
+            len(pending),
+            attempt_temperatures,
         )
-        current_temperature += temperature_step
-        # Small value for floating point comparison
-        if (
-            current_temperature > max_temperature + 1e-9
-            and translated_lines_list is None
-        ):
-            logger.info("  Reached maximum temperature (%.1f).", max_temperature)
-            break
 
-    if not translated_lines_list:
+        # Only the lines which have not been translated yet are sent, keeping their
+        # line numbers so that the translations can be merged into the chunk.
+        batch_inputs = []
+        batch_requests: list[tuple[int, set[int]]] = []
+        for i in pending:
+            missing_lines = [
+                (n, line)
+                for n, line in enumerate(chunks[i], start=1)
+                if n not in partial_translations[i]
+            ]
+            for group in _split_by_tokens(missing_lines):
+                lyrics_block = "\n".join(f"{n}|{line}" for n, line in group)
+                for temperature in attempt_temperatures:
+                    batch_inputs.append(
+                        {
+                            "lyrics": lyrics_block,
+                            "last_line_number": group[-1][0],
+                            "temperature": temperature,
+                        }
+                    )
+                    batch_requests.append((i, {n for n, _ in group}))
+
+        # Send the chunks concurrently. Each chunk keeps enough lines to preserve
+        # the flow of the lyrics while bounding the per-request latency.
+        responses = translator.batch(
+            batch_inputs, config={"max_concurrency": TRANSLATION_MAX_CONCURRENCY}
+        )
+
+        # The responses of each chunk are in the order of the temperature, so the
+        # first translation of each line comes from the lowest temperature.
+        # Only the line numbers which were sent are accepted, since a model which
+        # renumbers a sparse block would otherwise fill other lines with wrong text.
+        for (i, line_numbers), response_text in zip(batch_requests, responses):
+            translations = partial_translations[i]
+            for n, text in _parse_translation_response(response_text).items():
+                if n in line_numbers:
+                    translations.setdefault(n, text)
+
+        for i in pending:
+            translations = partial_translations[i]
+            missing_lines = [
+                n for n in range(1, len(chunks[i]) + 1) if n not in translations
+            ]
+
+            # If every line has its translation, accept the translation of the chunk
+            if not missing_lines:
+                translated_chunks[i] = [
+                    translations[n] for n in range(1, len(chunks[i]) + 1)
+                ]
+                _store_cached_translation(cache_keys[i], translated_chunks[i])
+                _store_cached_line_translations(chunks[i], translated_chunks[i])
+                continue
+
+            # If some lines are missing, retry only those lines with higher temperatures
+            logger.debug(
+                "  The translation of chunk %d (%.1f) is missing line(s) %s.",
+                i,
+                attempt_temperatures[-1],
+                missing_lines,
+            )
+
+    if any(lines is None for lines in translated_chunks):
         raise RuntimeError(
             "Warning: Translation failed for all temperature settings or the result was not in the expected format."
         )
 
-    # Create output data
-    lyrics = copy.copy(lyrics)
-    for i, item in enumerate(lyrics):
-        # Condition: For each dictionary, add a new key "translations",
-        #            and create a nested key "en" inside it
-        if "translations" not in item:
-            item["translations"] = {}
-        item["translations"]["en"] = translated_lines_list[i]
+    # Reassemble the translated chunks in their original order
+    return [line for lines in translated_chunks for line in lines]
+
+
+def add_translations(lyrics: list[dict], translated_lines: list[str]) -> list[dict]:
+    """
+    Adds the English translation of each line to the lyrics.
+    The i-th translated line is paired with the i-th line of the lyrics, and the lines
+    without a corresponding translation are left untranslated.
+
+    Args:
+        lyrics (list[dict]): Lyrics with "text", "start" and "end" keys.
+        translated_lines (list[str]): English translation of each line of the lyrics.
+
+    Returns:
+        The lyrics with the translation stored in item["translations"]["en"].
+    """
+    if len(translated_lines) != len(lyrics):
+        logger.warning(
+            "The number of translated lines (%d) does not match the number of lyric lines (%d).",
+            len(translated_lines),
+            len(lyrics),
+        )
+
+    # Create output data. New dictionaries are built so that the caller's lyrics
+    # are left untouched.
+    # Condition: For each dictionary, add a new key "translations",
+    #            and create a nested key "en" inside it
+    translated_lyrics = [
+        {**item, "translations": {**item.get("translations", {}), "en": translated}}
+        for item, translated in zip(lyrics, translated_lines)
+    ]
+    translated_lyrics += lyrics[len(translated_lines) :]
     logger.info("Incorporated translation results into output data.")
 
-    return lyrics
+    return translated_lyrics
+
+
+def translate_lyrics(lyrics: list[dict]) -> list[dict]:
+    """
+    Translates Japanese lyrics into English.
+
+    Args:
+        lyrics (list[dict]): Lyrics with "text", "start" and "end" keys.
+
+    Returns:
+        The lyrics with the translation stored in item["translations"]["en"].
+    """
+    # Check input data format
+    if not isinstance(lyrics, list):
+        raise TypeError("Error: The lyrics must be a list.")
+
+    # Validate the items and collect the texts in a single pass
+    required_keys = {"text", "start", "end"}
+    japanese_texts = []
+    for i, item in enumerate(lyrics):
+        if not isinstance(item, dict) or not required_keys <= item.keys():
+            raise RuntimeError(
+                "Error: Each element in the input file must be a dictionary with 'text', 'start', and 'end' keys."
+                f" (invalid element at index {i})"
+            )
+        japanese_texts.append(item["text"])
+
+    translated_lines = translate_lines(japanese_texts)
+    return add_translations(lyrics, translated_lines)
+
+
+@cache
+def _detect_hardware_encoder() -> str | None:
+    """
+    Detects a hardware H.264 encoder which can be used with the installed ffmpeg.
+
+    Returns:
+        The name of the encoder if available, otherwise None.
+    """
+    from moviepy.config import FFMPEG_BINARY
+
+    try:
+        encoders = subprocess.run(
+            [FFMPEG_BINARY, "-hide_banner", "-encoders"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+    for encoder, encoder_args in HARDWARE_ENCODER_ARGS.items():
+        if encoder not in encoders:
+            continue
+
+        # The encoder may be compiled in without a usable device or may not support
+        # the arguments (e.g. the quality mode), so try to encode a few frames
+        try:
+            subprocess.run(
+                [
+                    FFMPEG_BINARY,
+                    "-hide_banner",
+                    "-loglevel",
+                    "error",
+                    "-f",
+                    "lavfi",
+                    "-i",
+                    "color=size=256x256:duration=0.1",
+                    "-c:v",
+                    encoder,
+                    *encoder_args,
+                    "-f",
+                    "null",
+                    "-",
+                ],
+                capture_output=True,
+                check=True,
+                timeout=30,
+            )
+        except (OSError, subprocess.SubprocessError):
+            continue
+
+        logger.info("Using hardware encoder: %s", encoder)
+        return encoder
+
+    return None
+
+
+def _video_encoder_args(fps: int) -> list[str]:
+    """
+    Returns the ffmpeg arguments of the video encoder.
+    """
+    # Put the moov atom at the beginning of the file, so that the video can be
+    # played in the browser while it is still being downloaded
+    container_args = ["-pix_fmt", "yuv420p", "-movflags", "+faststart"]
+
+    encoder = _detect_hardware_encoder()
+    if encoder is not None:
+        return ["-c:v", encoder, *HARDWARE_ENCODER_ARGS[encoder]] + container_args
+
+    # The background is a still image and only the subtitles change,
+    # so tune x264 for still images and use a long keyframe interval.
+    # "ultrafast" writes files about 3 times larger than "veryfast" for this content.
+    return [
+        "-c:v",
+        "libx264",
+        "-preset",
+        "veryfast",
+        "-tune",
+        "stillimage",
+        "-crf",
+        "23",
+        "-g",
+        str(fps * 10),
+    ] + container_args
+
+
+def _audio_codec(music_file: str) -> str | None:
+    """
+    Returns the codec of the first audio stream of a file as reported by ffmpeg,
+    or None if it has no audio stream.
+    """
+    from moviepy.config import FFMPEG_BINARY
+
+    # ffmpeg prints the streams of the input even though no output is specified,
+    # and exits with an error since there is no output
+    result = subprocess.run(
+        [FFMPEG_BINARY, "-hide_banner", "-i", music_file],
+        capture_output=True,
+        check=False,
+    )
+    for line in result.stderr.decode(errors="replace").splitlines():
+        _, sep, stream_info = line.partition(" Audio: ")
+        if sep and stream_info.strip():
+            return stream_info.split(maxsplit=1)[0].rstrip(",")
+    return None
+
+
+@lru_cache(maxsize=16)
+def _load_font(font: str, font_size: int) -> ImageFont.FreeTypeFont:
+    """
+    Loads a font file once per font and size.
+    """
+    return ImageFont.truetype(font, font_size)
+
+
+@lru_cache(maxsize=1024)
+def _caption_height(text: str, font: str, font_size: int, stroke_width: int) -> int:
+    """
+    Measures the height of a caption, including its stroke.
+
+    The height is derived from the font metrics so that captions of the same font are aligned.
+    """
+    pil_font = _load_font(font, font_size)
+    ascent, descent = pil_font.getmetrics()
+
+    # Measure the text drawn from the baseline of the first line
+    draw = ImageDraw.Draw(Image.new("L", (1, 1)))
+    _, top, _, bottom = draw.multiline_textbbox(
+        (0, ascent),
+        text,
+        font=pil_font,
+        align="center",
+        stroke_width=stroke_width,
+        anchor="ls",
+    )
+    top = min(math.floor(top), -stroke_width)
+    bottom = max(math.ceil(bottom), ascent + descent + stroke_width)
+    return bottom - top
+
+
+def _ass_style(
+    name: str,
+    font: str,
+    font_size: int,
+    color: str,
+    stroke_color: str,
+    stroke_width: int,
+) -> str:
+    """
+    Builds an ASS style line which renders the text like Pillow does with the same font.
+    """
+    pil_font = _load_font(font, font_size)
+    family, style = pil_font.getname()
+    # The fields of a style line are separated by commas, and a font family cannot be
+    # quoted, so such a family would shift the fields
+    if "," in family:
+        raise ValueError(
+            f"Error: The font family '{family}' contains a comma and cannot be used "
+            "for the captions."
+        )
+    # libass scales the font so that its ascent + descent equals the font size
+    ascent, descent = pil_font.getmetrics()
+    bold = -1 if "bold" in style.lower() else 0
+    italic = -1 if "italic" in style.lower() else 0
+    return (
+        f"Style: {name},{family},{ascent + descent},{_ass_color(color)},"
+        f"{_ass_color(color)},{_ass_color(stroke_color)},&H00000000,{bold},{italic},"
+        f"0,0,100,100,0,0,1,{stroke_width},0,2,0,0,0,1"
+    )
+
+
+def _ass_color(color: str) -> str:
+    """
+    Converts a color name or code (e.g. "white", "#ff0000") into the ASS color format.
+    """
+    r, g, b = ImageColor.getrgb(color)[:3]
+    return f"&H00{b:02X}{g:02X}{r:02X}"
+
+
+def _ass_time(seconds: float) -> str:
+    """
+    Formats a time in seconds as an ASS timestamp (H:MM:SS.cc).
+    """
+    cs = round(seconds * 100)
+    return f"{cs // 360000}:{cs // 6000 % 60:02}:{cs // 100 % 60:02}.{cs % 100:02}"
+
+
+def _ass_text(text: str) -> str:
+    """
+    Escapes a caption so that braces are not interpreted as override tags.
+    A word joiner is inserted after each backslash, so that it is not interpreted as
+    an escape sequence (e.g. "\\N") and is rendered as is.
+    """
+    return (
+        text.replace("\\", "\\\u2060")
+        .replace("{", "\\{")
+        .replace("}", "\\}")
+        .replace("\n", "\\N")
+    )
+
+
+def preload_resources(font_names: list[str]) -> None:
+    """
+    Loads the resources which would otherwise be loaded lazily during the first request:
+    the langchain_openai and musicai_sdk modules, the tokenizer, the hardware encoder
+    detection and the fonts.
+
+    Args:
+        font_names (list[str]): Names of the fonts to look up in advance.
+    """
+    from langchain_openai import ChatOpenAI  # noqa: F401
+    from musicai_sdk import MusicAiClient  # noqa: F401
+
+    _count_tokens([""])
+    _detect_hardware_encoder()
+    for font_name in font_names:
+        get_font_path(font_name)
 
 
 def create_lyric_video(
@@ -323,8 +1300,8 @@ def create_lyric_video(
 
     Args:
         music_file (str): Path to the music file.
-        lyrics_file (str): Path to the lyrics JSON file.
         image_file (str): Path to the background image file.
+        lyrics (list[dict]): Aligned lyric lines with "text", "start", "end" and "translations".
         output_file (str): Path to save the output video file (default is "output.mp4").
         font_name_ja (str): Font name for Japanese text (default is "SourceHanSansJP-Regular").
         font_name_en (str): Font name for English text (default is "C:/Windows/Fonts/msmincho.ttc").
@@ -337,6 +1314,9 @@ def create_lyric_video(
         enable_fade (bool): Whether to enable fade-in and fade-out effects for subtitles (default is True).
         threads (int): Number of threads to use for video processing (default is 4).
     """
+    from moviepy.config import FFMPEG_BINARY
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
     logger.info("--- Start generating video ---")
     logger.debug(
         "Settings: Font=%s, Size=%d, Margin=%d", font_name_ja, font_size, margin_bottom
@@ -353,25 +1333,33 @@ def create_lyric_video(
     logger.info("font_path_ja: %s", font_path_ja.as_posix())
     logger.info("font_path_en: %s", font_path_en.as_posix())
 
-    audio_clip = None
-    background_clip = None
-    subtitle_clips = []
-    video: CompositeVideoClip | None = None
-
     try:
         # --- Load Input Files ---
+        # Each probe of the music file runs ffmpeg, so they run concurrently while
+        # the background image is read
         logger.info("Loading music file: %s", music_file)
-        audio_clip = AudioFileClip(music_file)
-        video_duration = audio_clip.duration
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            infos_future = executor.submit(ffmpeg_parse_infos, music_file)
+            codec_future = executor.submit(_audio_codec, music_file)
+
+            logger.info("Loading background image: %s", image_file)
+            with Image.open(image_file) as background_image:
+                image_width, image_height = background_image.size
+            # yuv420p requires even dimensions, so an odd width or height is rounded
+            # down by one pixel (or up, for an image only one pixel wide or high)
+            video_width = max(image_width - image_width % 2, 2)
+            video_height = max(image_height - image_height % 2, 2)
+            logger.debug("Video size: %dx%d", video_width, video_height)
+
+            video_duration = infos_future.result()["duration"]
+            audio_codec = codec_future.result()
+        logger.debug("Music file codec: %s", audio_codec)
         logger.debug("Music file duration: %.2f seconds", video_duration)
 
-        logger.info("Loading background image: %s", image_file)
-        background_clip = ImageClip(image_file).with_duration(video_duration)
-        video_width, video_height = background_clip.size
-        logger.debug("Video size: %dx%d", video_width, video_height)
-
-        # --- Generate Subtitle Clips ---
-        logger.info("Generating subtitle clips...")
+        # --- Generate Subtitles ---
+        logger.info("Generating subtitles...")
+        # (start time, duration, Japanese text, English text) of each subtitle
+        subtitles: list[tuple[float, float, str, str]] = []
         for i, lyric in enumerate(lyrics):
             start_time = lyric.get("start")
             end_time = lyric.get("end")
@@ -399,110 +1387,144 @@ def create_lyric_video(
 
             end_time = min(end_time, video_duration)
             duration = end_time - start_time
-
-            # Create TextClip
-            try:
-                txt_clip = TextClip(
-                    text=text,
-                    font_size=font_size,
-                    color=font_color,
-                    font=font_path_ja.as_posix(),
-                    stroke_color=stroke_color,
-                    stroke_width=stroke_width,
-                    method="label",
-                    text_align="center",
-                    # size=(int(video_width * 0.9), None),
-                )
-                # Set position and timing
-                txt_clip = (
-                    txt_clip.with_position(
-                        (
-                            "center",
-                            int(video_height - margin_bottom - txt_clip.h * 1.5 - 20),
-                        )
-                    )
-                    .with_start(start_time)
-                    .with_duration(duration)
-                )
-                if enable_fade:
-                    txt_clip = txt_clip.with_effects(
-                        [vfx.FadeIn(0.5), vfx.FadeOut(0.5)]
-                    )
-
-                subtitle_clips.append(txt_clip)
-
-                txt_clip = TextClip(
-                    text=lyric["translations"]["en"],
-                    font_size=font_size // 2,
-                    color=font_color,
-                    font=font_path_en.as_posix(),
-                    stroke_color=stroke_color,
-                    stroke_width=stroke_width,
-                    method="label",
-                    text_align="center",
-                    # size=(int(video_width * 0.9), None),
-                )
-                # Set position and timing
-                txt_clip = (
-                    txt_clip.with_position(
-                        ("center", video_height - margin_bottom - txt_clip.h)
-                    )
-                    .with_start(start_time)
-                    .with_duration(duration)
-                )
-                if enable_fade:
-                    txt_clip = txt_clip.with_effects(
-                        [vfx.FadeIn(0.5), vfx.FadeOut(0.5)]
-                    )
-
-                subtitle_clips.append(txt_clip)
-
-            except Exception as e:
-                logger.error(
-                    "Error: Failed to create text clip (line %d): '%s' - %s",
-                    i + 1,
-                    text,
-                    e,
-                )
-                logger.error(
-                    "Please check if the '%s' font is installed on your system or if the path is correct.",
-                    font_name_ja,
+            # A line may have no translation if the lyrics and their alignment differ
+            text_en = lyric.get("translations", {}).get("en", "")
+            subtitles.append((start_time, duration, text, text_en))
+
+        # --- Write Subtitle File ---
+        # The subtitles are rendered by libass within ffmpeg, instead of compositing
+        # an image per subtitle in Python.
+        font_ja = font_path_ja.as_posix()
+        font_en = font_path_en.as_posix()
+        fade = (
+            f"\\fad({SUBTITLE_FADE_DURATION},{SUBTITLE_FADE_DURATION})"
+            if enable_fade
+            else ""
+        )
+        ass_lines = [
+            "[Script Info]",
+            "ScriptType: v4.00+",
+            f"PlayResX: {video_width}",
+            f"PlayResY: {video_height}",
+            "WrapStyle: 2",
+            "ScaledBorderAndShadow: yes",
+            "",
+            "[V4+ Styles]",
+            (
+                "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, "
+                "OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, "
+                "ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+                "Alignment, MarginL, MarginR, MarginV, Encoding"
+            ),
+            _ass_style(
+                "Japanese", font_ja, font_size, font_color, stroke_color, stroke_width
+            ),
+            _ass_style(
+                "English",
+                font_en,
+                font_size // 2,
+                font_color,
+                stroke_color,
+                stroke_width,
+            ),
+            "",
+            "[Events]",
+            "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+        ]
+        # The subtitles are positioned by their bottom center, so that the subtitles
+        # shown at the same time are drawn over each other instead of being stacked
+        # by libass. Only the position of the Japanese captions depends on the text.
+        x = f"{video_width / 2:g}"
+        y_ja_base = video_height - margin_bottom - 20
+        tags_en = f"{{\\an2\\pos({x},{video_height - margin_bottom}){fade}}}"
+        for start_time, duration, text_ja, text_en in subtitles:
+            start = _ass_time(start_time)
+            end = _ass_time(start_time + duration)
+            height = _caption_height(text_ja, font_ja, font_size, stroke_width)
+            y_ja = int(y_ja_base - height * 0.5)
+            ass_lines.append(
+                f"Dialogue: 0,{start},{end},Japanese,,0,0,0,,"
+                f"{{\\an2\\pos({x},{y_ja}){fade}}}{_ass_text(text_ja)}"
+            )
+            if text_en:
+                ass_lines.append(
+                    f"Dialogue: 0,{start},{end},English,,0,0,0,,{tags_en}{_ass_text(text_en)}"
                 )
-                raise  # Re-raise the error to abort processing
-
-        logger.info("Generated %d subtitle clips.", len(subtitle_clips))
-
-        # --- Combine Clips ---
-        logger.info("Combining video and subtitle clips...")
-        final_clips = [background_clip] + subtitle_clips
-        video = CompositeVideoClip(final_clips, size=(video_width, video_height))
-        assert video is not None
-
-        # --- Set Audio ---
-        logger.info("Setting audio to video...")
-        video = video.with_audio(audio_clip)
-        assert video is not None
-
-        # logger.info("Video preview")
-        # video.show(34.0)
-        # video = video.subclipped(0, 10)
-        # video.preview(3, audio=False)
-        # return
 
-        # tmp
-        # video = video.subclipped(0, 3)
+        logger.info("Generated %d subtitles.", len(subtitles))
 
         # --- Write Output Video File ---
-        logger.info("Writing video file '%s'...", output_file)
-        video.write_videofile(
-            output_file,
-            codec="libx264",
-            audio_codec="aac",
-            fps=fps,
-            threads=threads,
-            logger="bar",
-            preset="ultrafast",
-        )
+        with tempfile.TemporaryDirectory(
+            dir=Path(output_file).absolute().parent
+        ) as work_dir:
+            Path(work_dir, "lyrics.ass").write_text(
+                "\n".join(ass_lines) + "\n", encoding="utf-8"
+            )
+
+            # Make the fonts available to libass by their family names.
+            # ffmpeg runs in work_dir so that the filter options need no escaping.
+            fonts_dir = Path(work_dir, "fonts")
+            fonts_dir.mkdir()
+            for i, font_path in enumerate(dict.fromkeys([font_path_ja, font_path_en])):
+                font_copy = fonts_dir / f"{i}{font_path.suffix}"
+                try:
+                    os.link(font_path, font_copy)
+                except OSError:
+                    shutil.copyfile(font_path, font_copy)
+
+            # The background image is decoded and converted only once, and the frame
+            # is repeated for the whole video inside the filtergraph
+            video_filters = []
+            if (video_width, video_height) != (image_width, image_height):
+                video_filters.append(f"scale={video_width}:{video_height}")
+            video_filters += [
+                "format=yuv420p",
+                "loop=loop=-1:size=1",
+                f"setpts=N/{fps}/TB",
+                "subtitles=lyrics.ass:fontsdir=fonts",
+            ]
+
+            logger.info("Writing video file '%s'...", output_file)
+            result = subprocess.run(
+                [
+                    FFMPEG_BINARY,
+                    "-hide_banner",
+                    "-loglevel",
+                    "error",
+                    "-nostdin",
+                    "-y",
+                    "-i",
+                    os.path.abspath(image_file),
+                    "-i",
+                    os.path.abspath(music_file),
+                    "-vf",
+                    ",".join(video_filters),
+                    "-map",
+                    "0:v",
+                    "-map",
+                    "1:a",
+                    "-r",
+                    str(fps),
+                    *_video_encoder_args(fps),
+                    # The audio is copied when the container supports it, which is
+                    # faster and avoids the quality loss of re-encoding
+                    "-c:a",
+                    "copy" if audio_codec in COPYABLE_AUDIO_CODECS else "aac",
+                    "-threads",
+                    str(threads),
+                    "-t",
+                    f"{video_duration:.3f}",
+                    os.path.abspath(output_file),
+                ],
+                cwd=work_dir,
+                capture_output=True,
+                check=False,
+            )
+            if result.returncode != 0:
+                raise RuntimeError(
+                    "ffmpeg failed to write the video: "
+                    + result.stderr.decode(errors="replace").strip()
+                )
         logger.info("Video file created successfully: %s", output_file)
 
     except FileNotFoundError as e:
@@ -512,21 +1534,5 @@ def create_lyric_video(
             "Error: Unexpected problem occurred during video generation - %s", e
         )
         raise e
-    finally:
-        logger.info("Releasing resources...")
-        # --- Clean up resources ---
-        try:
-            if audio_clip:
-                audio_clip.close()
-            if background_clip:
-                background_clip.close()
-            for clip in subtitle_clips:
-                if clip:
-                    clip.close()
-            if video:
-                video.close()
-            logger.info("Cleanup complete.")
-        except Exception as e:
-            logger.warning(f"Warning: Error occurred during resource cleanup - {e}")
 
     logger.info("--- Video generation finished ---")
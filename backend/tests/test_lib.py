@@ -0,0 +1,351 @@
+import os
+import re
+import tempfile
+import unittest
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+import requests
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from musicai_sdk import MusicAiClient
+
+from lyrics_video_creator import lib
+from lyrics_video_creator.lib import _is_transient_musicai_error
+
+
+def _response(status_code: int, content: bytes = b"") -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    return response
+
+
+class IsTransientMusicAiErrorTest(unittest.TestCase):
+    """
+    The MusicAI SDK raises HTTPError without the response, so the status code is read
+    from the message. These tests pin the message format of the installed SDK.
+    """
+
+    def _raise_from_sdk(self, call, *responses: requests.Response) -> BaseException:
+        client = MusicAiClient(api_key="test")
+        with (
+            mock.patch("requests.Session.request", side_effect=responses),
+            self.assertRaises(requests.HTTPError) as context,
+        ):
+            call(client)
+        return context.exception
+
+    def test_server_error_is_transient(self):
+        error = self._raise_from_sdk(
+            lambda client: client.get_job("job"), _response(503, b"Unavailable")
+        )
+        self.assertTrue(_is_transient_musicai_error(error))
+
+    def test_rate_limit_is_transient(self):
+        error = self._raise_from_sdk(
+            lambda client: client.get_application_info(), _response(429)
+        )
+        self.assertTrue(_is_transient_musicai_error(error))
+
+    def test_client_error_is_not_transient(self):
+        error = self._raise_from_sdk(
+            lambda client: client.get_job("job"), _response(404, b"Not Found")
+        )
+        self.assertFalse(_is_transient_musicai_error(error))
+
+    def test_upload_error_is_transient(self):
+        upload_urls = b'{"uploadUrl": "https://upload", "downloadUrl": "https://file"}'
+        with mock.patch("builtins.open", mock.mock_open(read_data=b"data")):
+            error = self._raise_from_sdk(
+                lambda client: client.upload_file("music.mp3"),
+                _response(200, upload_urls),
+                _response(502, b"Bad Gateway"),
+            )
+        self.assertTrue(_is_transient_musicai_error(error))
+
+    def test_status_code_of_response_is_used(self):
+        error = requests.HTTPError("Error", response=_response(500))
+        self.assertTrue(_is_transient_musicai_error(error))
+
+    def test_connection_error_is_transient(self):
+        self.assertTrue(_is_transient_musicai_error(requests.ConnectionError()))
+        self.assertFalse(_is_transient_musicai_error(ValueError()))
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model which streams the response of respond(numbered_lines, temperature)
+    line by line, and records the requests and the streamed lines.
+    """
+
+    respond: Callable[[list[tuple[int, str]], float], str]
+    requests: list[tuple[list[int], float]] = []
+    streamed_lines: list[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        temperature = kwargs.get("temperature", 0.0)
+        lyrics = re.search(r"<lyrics>\n(.*)\n</lyrics>", messages[-1].content, re.S)
+        numbered_lines = []
+        for line in lyrics.group(1).split("\n"):
+            number, _, text = line.partition("|")
+            numbered_lines.append((int(number), text))
+        self.requests.append(([n for n, _ in numbered_lines], temperature))
+
+        # Like the OpenAI API, the stream starts with an empty chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content=""))
+
+        for line in self.respond(numbered_lines, temperature).splitlines(keepends=True):
+            self.streamed_lines.append(line)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=line))
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = "".join(
+            chunk.text for chunk in self._stream(messages, stop, run_manager, **kwargs)
+        )
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+
+def _translate(numbered_lines: list[tuple[int, str]], temperature: float) -> str:
+    return "".join(f"{n}|EN {text}\n" for n, text in numbered_lines)
+
+
+class TranslationTestCase(unittest.TestCase):
+    """
+    Runs the translation with a fake chat model and an empty cache directory.
+    """
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        for patcher in (
+            mock.patch.object(lib, "CACHE_DIR", Path(cache_dir.name)),
+            mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test"}),
+            # Count the characters rather than downloading the tokenizer
+            mock.patch.object(lib, "_get_token_encoding", return_value=None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _translate_lines(
+        self,
+        lines: list[str],
+        respond: Callable[[list[tuple[int, str]], float], str],
+    ) -> tuple[list[str], FakeChatModel]:
+        chat_model = FakeChatModel(respond=respond)
+        with mock.patch.object(lib, "_get_chat_model", return_value=chat_model):
+            return lib.translate_lines(lines), chat_model
+
+
+class TranslationProtocolTest(TranslationTestCase):
+    def test_dropped_line_is_retried_and_merged(self):
+        def respond(numbered_lines, temperature):
+            if temperature == 0.0:
+                numbered_lines = [(n, text) for n, text in numbered_lines if n != 3]
+            return _translate(numbered_lines, temperature)
+
+        lines = [f"line{n}" for n in range(1, 6)]
+        translated_lines, chat_model = self._translate_lines(lines, respond)
+
+        self.assertEqual(translated_lines, [f"EN {line}" for line in lines])
+        # Only the dropped line is sent again, with the next temperatures
+        self.assertEqual(
+            sorted(chat_model.requests),
+            [([1, 2, 3, 4, 5], 0.0), ([3], 0.2), ([3], 0.4), ([3], 0.6)],
+        )
+
+    def test_lines_out_of_the_request_are_rejected(self):
+        def respond(numbered_lines, temperature):
+            if temperature == 0.0 and numbered_lines[0][0] == 1:
+                return ""
+            if temperature == 0.0:
+                # Renumbered from 1, and a line past the end of the chunk
+                renumbered_lines = [
+                    (k, text) for k, (_, text) in enumerate(numbered_lines, start=1)
+                ]
+                return _translate(renumbered_lines + [(9, "line9")], temperature)
+            return _translate(numbered_lines, temperature)
+
+        lines = ["line1", "line2"]
+        # Send each line in its own request
+        with mock.patch.object(lib, "TRANSLATION_MAX_CHUNK_TOKENS", 1):
+            translated_lines, chat_model = self._translate_lines(lines, respond)
+
+        self.assertEqual(translated_lines, ["EN line1", "EN line2"])
+        # Neither the dropped line nor the renumbered line is accepted at first
+        self.assertIn(([1], 0.2), chat_model.requests)
+        self.assertIn(([2], 0.2), chat_model.requests)
+
+    def test_stream_stops_at_last_line(self):
+        def respond(numbered_lines, temperature):
+            return "1|one\n2|two\n3|three\n4|four\n5|five\n"
+
+        chat_model = FakeChatModel(respond=respond)
+        response_text = lib._stream_translation(
+            chat_model,
+            {"lyrics": "1|一\n2|二", "last_line_number": 2, "temperature": 0.0},
+        )
+
+        self.assertEqual(response_text, "1|one\n2|two")
+        self.assertNotIn("5|five\n", chat_model.streamed_lines)
+
+    def test_chunks_are_split_at_line_and_token_limits(self):
+        lines = [f"line{n:02d}" for n in range(1, 46)]
+        chunks = lib._split_into_chunks(lines)
+        self.assertEqual([len(chunk) for chunk in chunks], [20, 20, 5])
+        self.assertEqual(chunks[2], lines[40:])
+
+        # Each line counts 6 characters and 2 tokens for the line number
+        numbered_lines = list(enumerate(chunks[0], start=1))
+        with mock.patch.object(lib, "TRANSLATION_MAX_CHUNK_TOKENS", 20):
+            groups = lib._split_by_tokens(numbered_lines)
+        self.assertEqual([len(group) for group in groups], [2] * 10)
+        self.assertEqual([n for group in groups for n, _ in group], list(range(1, 21)))
+
+        # A line longer than the limit is sent alone rather than dropped
+        with mock.patch.object(lib, "TRANSLATION_MAX_CHUNK_TOKENS", 5):
+            groups = lib._split_by_tokens(numbered_lines[:3])
+        self.assertEqual([len(group) for group in groups], [1, 1, 1])
+
+
+class TranslationCacheTest(TranslationTestCase):
+    def test_edited_line_is_translated_alone(self):
+        lines = [f"line{n}" for n in range(1, 26)]
+        translated_lines, chat_model = self._translate_lines(lines, _translate)
+        self.assertEqual(translated_lines, [f"EN {line}" for line in lines])
+        self.assertEqual(len(chat_model.requests), 2)
+
+        # The second chunk is unchanged and the first chunk reuses the translations
+        # of its unchanged lines
+        lines[4] = "edited"
+        translated_lines, chat_model = self._translate_lines(lines, _translate)
+        self.assertEqual(translated_lines[4], "EN edited")
+        self.assertEqual(translated_lines[:4], [f"EN line{n}" for n in range(1, 5)])
+        self.assertEqual(chat_model.requests, [([5], 0.0)])
+
+        # Everything is cached now
+        translated_lines, chat_model = self._translate_lines(lines, _translate)
+        self.assertEqual(translated_lines[4], "EN edited")
+        self.assertEqual(chat_model.requests, [])
+
+
+class LineCountMismatchTest(unittest.TestCase):
+    def _lyrics(self, num_lines: int) -> list[dict]:
+        return [
+            {"text": f"line{n}", "start": n * 10.0, "end": n * 10.0 + 2.0}
+            for n in range(num_lines)
+        ]
+
+    def test_missing_translations_are_left_untranslated(self):
+        lyrics = self._lyrics(3)
+        with self.assertLogs(lib.logger, "WARNING"):
+            translated_lyrics = lib.add_translations(lyrics, ["EN 0", "EN 1"])
+
+        self.assertEqual(len(translated_lyrics), 3)
+        self.assertEqual(translated_lyrics[1]["translations"], {"en": "EN 1"})
+        self.assertNotIn("translations", translated_lyrics[2])
+        # The lyrics of the caller are not modified
+        self.assertNotIn("translations", lyrics[0])
+
+    def test_extra_translations_are_ignored(self):
+        with self.assertLogs(lib.logger, "WARNING"):
+            translated_lyrics = lib.add_translations(self._lyrics(1), ["EN 0", "EN 1"])
+
+        self.assertEqual(len(translated_lyrics), 1)
+        self.assertEqual(translated_lyrics[0]["translations"], {"en": "EN 0"})
+
+    def test_timing_is_corrected_for_all_aligned_lines(self):
+        with self.assertLogs(lib.logger, "WARNING"):
+            corrected_lyrics = lib.correct_lyrics_timing(
+                ["original0", "original1"], self._lyrics(3)
+            )
+
+        self.assertEqual(
+            [lyric["text"] for lyric in corrected_lyrics],
+            ["original0", "original1", "line2"],
+        )
+        self.assertEqual(
+            [lyric["end"] for lyric in corrected_lyrics], [3.0, 13.0, 22.0]
+        )
+
+    def test_extra_original_lines_are_ignored(self):
+        with self.assertLogs(lib.logger, "WARNING"):
+            corrected_lyrics = lib.correct_lyrics_timing(
+                ["original0", "original1"], self._lyrics(1)
+            )
+
+        self.assertEqual(len(corrected_lyrics), 1)
+        self.assertEqual(corrected_lyrics[0]["text"], "original0")
+
+
+class AssTest(unittest.TestCase):
+    def test_time_is_rounded_to_centiseconds(self):
+        self.assertEqual(lib._ass_time(0.004), "0:00:00.00")
+        self.assertEqual(lib._ass_time(1.236), "0:00:01.24")
+        self.assertEqual(lib._ass_time(59.999), "0:01:00.00")
+        self.assertEqual(lib._ass_time(3599.996), "1:00:00.00")
+        self.assertEqual(lib._ass_time(3661.5), "1:01:01.50")
+
+    def test_text_is_escaped(self):
+        self.assertEqual(lib._ass_text("{\\b1}bold"), "\\{\\\u2060b1\\}bold")
+        self.assertEqual(lib._ass_text("C:\\New"), "C:\\\u2060New")
+        self.assertEqual(lib._ass_text("first\nsecond"), "first\\Nsecond")
+
+    def test_color_is_in_bgr_order(self):
+        self.assertEqual(lib._ass_color("#123456"), "&H00563412")
+        self.assertEqual(lib._ass_color("red"), "&H000000FF")
+
+    def test_font_family_with_comma_is_rejected(self):
+        font = mock.Mock()
+        font.getname.return_value = ("Font, Inc. Sans", "Regular")
+        font.getmetrics.return_value = (30, 8)
+        with (
+            mock.patch.object(lib, "_load_font", return_value=font),
+            self.assertRaises(ValueError),
+        ):
+            lib._ass_style("English", "font.ttf", 32, "white", "black", 2)
+
+    def test_style_fields(self):
+        font = mock.Mock()
+        font.getname.return_value = ("Noto Sans", "Bold")
+        font.getmetrics.return_value = (30, 8)
+        with mock.patch.object(lib, "_load_font", return_value=font):
+            style = lib._ass_style("English", "font.ttf", 32, "white", "black", 2)
+        fields = style.removeprefix("Style: ").split(",")
+        self.assertEqual(len(fields), 23)
+        self.assertEqual(
+            fields[:8],
+            [
+                "English",
+                "Noto Sans",
+                "38",
+                "&H00FFFFFF",
+                "&H00FFFFFF",
+                "&H00000000",
+                "&H00000000",
+                "-1",
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()